@@ -1,11 +1,263 @@
+import asyncio
+import codecs
+import aiohttp
+from aiolimiter import AsyncLimiter
+import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import csv
+from lxml import etree
+import lxml.html
 import json
-import time
-import random
+import operator
 from urllib.parse import urlencode
 from datetime import datetime
+from functools import lru_cache, reduce
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# aiohttp and urllib3 decode br responses transparently when either is installed
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Transient server errors worth retrying in _fetch_page; 429 is left alone so a
+# rate limit isn't hammered
+_RETRY_STATUSES = (500, 502, 503, 504)
+_MAX_RETRIES = 3
+_RETRY_BACKOFF = 0.5
+
+# One bit per selectable field, so per-item checks are integer tests
+_TITLE, _PRICE, _CONDITION, _SHIPPING, _LOCATION, _URL, _IMAGE_URL, _SOLD_COUNT = (1 << i for i in range(8))
+_FIELD_BITS = {
+    'title': _TITLE,
+    'price': _PRICE,
+    'condition': _CONDITION,
+    'shipping': _SHIPPING,
+    'location': _LOCATION,
+    'url': _URL,
+    'image_url': _IMAGE_URL,
+    'sold_count': _SOLD_COUNT,
+}
+
+
+def _has_class(name):
+    """XPath predicate matching elements whose class list contains name"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+# XPath expressions used for every listing, compiled once up front
+_HEADING_XPATH = etree.XPath('.//span[@role="heading"]')
+_TITLE_DIV_XPATH = etree.XPath(f'.//div[{_has_class("s-item__title")}]')
+_TITLE_H3_XPATH = etree.XPath(f'.//h3[{_has_class("s-item__title")}]')
+_PRICE_XPATH = etree.XPath(f'.//span[{_has_class("s-item__price")}]')
+_CONDITION_XPATH = etree.XPath(f'.//span[{_has_class("SECONDARY_INFO")}]')
+_CONDITION_TEXT_XPATH = etree.XPath(
+    './/span[contains(text(), "New") or contains(text(), "Used") or contains(text(), "Pre-Owned")]'
+)
+_SHIPPING_XPATH = etree.XPath(f'.//span[{_has_class("s-item__shipping")}]')
+_LOGISTICS_COST_XPATH = etree.XPath(f'.//span[{_has_class("s-item__logisticsCost")}]')
+_LINK_XPATH = etree.XPath(f'.//a[{_has_class("s-item__link")}]')
+_LOCATION_XPATH = etree.XPath(f'.//span[{_has_class("s-item__location")}]')
+_ITEM_LOCATION_XPATH = etree.XPath(f'.//span[{_has_class("s-item__itemLocation")}]')
+_IMG_XPATH = etree.XPath('.//img')
+_SOLD_XPATH = etree.XPath(f'.//span[{_has_class("s-item__quantitySold")}]')
+
+
+def _find(item, *xpaths):
+    """Return the first element matched, trying each XPath in order"""
+    for xpath in xpaths:
+        found = xpath(item)
+        if found:
+            return found[0]
+    return None
+
+
+@lru_cache(maxsize=None)
+def _html_parser(encoding):
+    """HTML parser that decodes with a known charset instead of sniffing one"""
+    # libxml2 doesn't know every label Python does (e.g. 'latin-1'), and vice versa
+    labels = [encoding]
+    try:
+        labels.append(codecs.lookup(encoding).name)
+    except LookupError:
+        pass
+    
+    for label in labels:
+        try:
+            return lxml.html.HTMLParser(encoding=label)
+        except LookupError:
+            continue
+    
+    # Unknown charset - let lxml detect it from the document
+    return lxml.html.HTMLParser()
+
+
+def _iter_items(root):
+    """Yield listing containers one at a time without building a list first"""
+    # Try multiple selectors as eBay's HTML can vary
+    found = False
+    for item in root.iter('li'):
+        if 's-item' in item.get('class', '').split():
+            found = True
+            yield item
+    
+    if not found:
+        # Try alternative selector
+        for item in root.iter('div'):
+            if 's-item__wrapper' in item.get('class', '').split():
+                yield item
+
+
+def _text(elem):
+    """Stripped text content of an element, like BeautifulSoup's get_text(strip=True)"""
+    return ''.join(text.strip() for text in elem.itertext())
+
+
+def _extract_price(item):
+    price_elem = _find(item, _PRICE_XPATH)
+    return _text(price_elem) if price_elem is not None else 'N/A'
+
+
+def _extract_condition(item):
+    condition_elem = _find(item, _CONDITION_XPATH, _CONDITION_TEXT_XPATH)
+    return _text(condition_elem) if condition_elem is not None else 'N/A'
+
+
+def _extract_shipping(item):
+    shipping_elem = _find(item, _SHIPPING_XPATH, _LOGISTICS_COST_XPATH)
+    return _text(shipping_elem) if shipping_elem is not None else 'N/A'
+
+
+def _extract_url(item):
+    a_tag = _find(item, _LINK_XPATH)
+    return a_tag.get('href', 'N/A') if a_tag is not None else 'N/A'
+
+
+def _extract_location(item):
+    location_elem = _find(item, _LOCATION_XPATH, _ITEM_LOCATION_XPATH)
+    return _text(location_elem) if location_elem is not None else 'N/A'
+
+
+def _extract_image_url(item):
+    img_tag = _find(item, _IMG_XPATH)
+    if img_tag is not None:
+        return img_tag.get('src', img_tag.get('data-src', 'N/A'))
+    return 'N/A'
+
+
+def _extract_sold_count(item):
+    sold_elem = _find(item, _SOLD_XPATH)
+    return _text(sold_elem) if sold_elem is not None else '0'
+
+
+# Extractors for every field except the title, in output column order
+_FIELD_EXTRACTORS = (
+    (_PRICE, 'price', _extract_price),
+    (_CONDITION, 'condition', _extract_condition),
+    (_SHIPPING, 'shipping', _extract_shipping),
+    (_URL, 'url', _extract_url),
+    (_LOCATION, 'location', _extract_location),
+    (_IMAGE_URL, 'image_url', _extract_image_url),
+    (_SOLD_COUNT, 'sold_count', _extract_sold_count),
+)
+
+
+def _field_extractors(mask):
+    """(field, extractor) pairs for just the fields selected in mask"""
+    return tuple((field, extract) for bit, field, extract in _FIELD_EXTRACTORS if mask & bit)
+
+
+def _field_names(mask):
+    """Column names for the fields selected in mask, in extraction order"""
+    names = (['title'] if mask & _TITLE else []) + [field for field, _ in _field_extractors(mask)]
+    if mask & _CONDITION:
+        # Pre-folded copy so filter_by_condition doesn't casefold the column on every call
+        names.append('_cond_lc')
+    return names
+
+
+def _extract_product_data(item, mask, extractors, condition_index=None, debug_mode=False):
+    """Extract only selected fields from a product listing, in _field_names order"""
+    try:
+        values = []
+        
+        # Title - try multiple selectors
+        if mask & _TITLE:
+            title_elem = _find(item, _HEADING_XPATH, _TITLE_DIV_XPATH, _TITLE_H3_XPATH)
+            
+            if title_elem is not None:
+                title = _text(title_elem)
+                # Skip sponsored/header items
+                if title in ['Shop on eBay', 'New Listing', '']:
+                    return None
+                values.append(title)
+            else:
+                if debug_mode:
+                    print("Debug: Could not find title")
+                return None
+        
+        # Remaining fields - only the ones selected in mask
+        for _, extract in extractors:
+            values.append(extract(item))
+        
+        if condition_index is not None:
+            values.append(values[condition_index].casefold())
+        
+        return tuple(values) if values else None
+        
+    except Exception as e:
+        if debug_mode:
+            print(f"Debug: Extraction error - {e}")
+        return None
+
+
+def _parse_page_bytes(job):
+    """Parse one search results page into per-field value lists.
+    
+    Driven only by its arguments so it can run on a worker thread without
+    touching scraper state. Returns (columns, item_count).
+    """
+    content, encoding, mask, debug_mode = job
+    extractors = _field_extractors(mask)
+    names = _field_names(mask)
+    condition_index = names.index('condition') if mask & _CONDITION else None
+    columns = [[] for _ in names]
+    
+    if content is None:
+        return columns, 0
+    
+    try:
+        root = lxml.html.fromstring(content, parser=_html_parser(encoding))
+        found = 0
+        
+        idx = -1
+        for idx, item in enumerate(_iter_items(root)):
+            values = _extract_product_data(item, mask, extractors, condition_index, debug_mode)
+            if values:
+                for column, value in zip(columns, values):
+                    column.append(value)
+                found += 1
+            elif debug_mode and idx < 3:
+                print(f"Debug: Failed to extract data from item {idx}")
+        
+        if debug_mode:
+            print(f"\nDebug: Found {idx + 1} item containers")
+        
+        return columns, found
+        
+    except Exception as e:
+        print(f"\n❌ Unexpected Error: {e}")
+        if debug_mode:
+            import traceback
+            traceback.print_exc()
+        return [[] for _ in columns], 0
+
 
 class EbayScraper:
     def __init__(self):
@@ -15,7 +267,8 @@ class EbayScraper:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
+            # Only advertise br when we can actually decode it
+            'Accept-Encoding': 'gzip, deflate, br' if brotli else 'gzip, deflate',
             'DNT': '1',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
@@ -27,7 +280,12 @@ class EbayScraper:
         self.session = requests.Session()
         self.session.headers.update(self.headers)
         self.selected_fields = []
+        self._field_mask = 0
+        self._fields = []
+        # Scraped data, one list per field (struct-of-arrays)
+        self.columns = {}
         self.debug_mode = False
+        self._run_timestamp = None
         
     def get_user_preferences(self):
         """Interactive menu to get user preferences"""
@@ -165,6 +423,15 @@ class EbayScraper:
     
     def search(self, query, max_pages=3, sort_by='best_match', min_price=None, max_price=None):
         """Search eBay for products"""
+        # Resolve the selected fields once per run, whoever set them
+        self._field_mask = reduce(operator.or_, (_FIELD_BITS.get(f, 0) for f in self.selected_fields), 0)
+        self._fields = _field_names(self._field_mask)
+        # One timestamp for the whole run rather than one per item
+        self._run_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return asyncio.run(self._search_async(query, max_pages, sort_by, min_price, max_price))
+    
+    async def _search_async(self, query, max_pages, sort_by, min_price, max_price):
+        """Fetch all result pages concurrently, then parse them in order"""
         sort_options = {
             'best_match': 12,
             'price_low': 15,
@@ -184,21 +451,31 @@ class EbayScraper:
         if max_price:
             params['_udhi'] = max_price
         
-        all_products = []
+        # Encode the shared query once; only the page number changes
+        base_qs = urlencode(params)
+        urls = [f"{self.base_url}?{base_qs}&_pgn={page}" for page in range(1, max_pages + 1)]
         
-        for page in range(1, max_pages + 1):
-            params['_pgn'] = page
-            url = f"{self.base_url}?{urlencode(params)}"
-            
+        # Be nice to eBay's servers - at most 3 pages in flight at once,
+        # started no faster than one every 2 seconds
+        sem = asyncio.Semaphore(3)
+        limiter = AsyncLimiter(max_rate=1, time_period=2.0)
+        connector = aiohttp.TCPConnector(limit=4, ttl_dns_cache=300)
+        
+        async with aiohttp.ClientSession(headers=self.headers, connector=connector) as session:
+            parsed = await asyncio.gather(*[self._fetch_and_parse(session, url, sem, limiter) for url in urls])
+        
+        self.columns = {field: [] for field in self._fields}
+        
+        for page, (url, (page_columns, found)) in enumerate(zip(urls, parsed), 1):
             if self.debug_mode:
                 print(f"\nDebug: URL = {url}")
             
             print(f"Scraping page {page}/{max_pages}...", end=' ')
-            products = self._scrape_page(url)
-            all_products.extend(products)
-            print(f"✓ Found {len(products)} items")
+            for field, values in zip(self._fields, page_columns):
+                self.columns[field].extend(values)
+            print(f"✓ Found {found} items")
             
-            if len(products) == 0 and page == 1:
+            if found == 0 and page == 1:
                 print("\n⚠️  WARNING: No products found. Possible reasons:")
                 print("   - eBay is blocking the request")
                 print("   - The search query returned no results")
@@ -207,13 +484,48 @@ class EbayScraper:
                 
                 if self.debug_mode:
                     print("\nTrying to diagnose the issue...")
+                    # Every fetch has finished by now, so the blocking probe can't stall anything
                     self._diagnose_issue(url)
                 break
-            
-            # Be nice to eBay's servers
-            time.sleep(random.uniform(2, 4))
         
-        return all_products
+        # dtype=object keeps text columns usable with .str even when nothing was scraped
+        products = pd.DataFrame(self.columns, columns=self._fields, dtype=object)
+        return products.assign(scraped_at=self._run_timestamp)
+    
+    async def _fetch_and_parse(self, session, url, sem, limiter):
+        """Fetch one page and parse it as soon as it arrives, while later pages are still pending"""
+        content, encoding = await self._fetch_page(session, url, sem, limiter)
+        job = (content, encoding, self._field_mask, self.debug_mode)
+        # Fetches are spaced 2s apart and a page parses in tens of ms, so a worker
+        # thread keeps the loop free without paying for a process pool
+        return await asyncio.get_running_loop().run_in_executor(None, _parse_page_bytes, job)
+    
+    async def _fetch_page(self, session, url, sem, limiter):
+        """Fetch the raw bytes and declared charset of a single search results page"""
+        async with sem:
+            for attempt in range(_MAX_RETRIES + 1):
+                last_attempt = attempt == _MAX_RETRIES
+                try:
+                    async with limiter, session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+                        if response.status not in _RETRY_STATUSES or last_attempt:
+                            response.raise_for_status()
+                            if self.debug_mode:
+                                encoding = response.headers.get('Content-Encoding', 'identity')
+                                print(f"\nDebug: {url} served with Content-Encoding = {encoding}")
+                            # Raw bytes - lxml decodes them in C with the declared charset
+                            return await response.read(), response.charset or 'utf-8'
+                        if self.debug_mode:
+                            print(f"\nDebug: {url} returned {response.status}, retrying")
+                except aiohttp.ClientResponseError as e:
+                    print(f"\n❌ Network Error: {e}")
+                    return None, None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if last_attempt:
+                        print(f"\n❌ Network Error: {e}")
+                        return None, None
+                
+                # Transient failure - back off before trying again
+                await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
     
     def _diagnose_issue(self, url):
         """Diagnose why scraping might be failing"""
@@ -229,161 +541,57 @@ class EbayScraper:
                 print("❌ 429 Too Many Requests - You're being rate limited")
                 print("   Solution: Wait a few minutes and try again")
             
-            # Check if we got a CAPTCHA page
-            if 'captcha' in response.text.lower() or 'robot' in response.text.lower():
+            # Check if we got a CAPTCHA page - scan the raw bytes, no decode needed
+            body = response.content.lower()
+            if b'captcha' in body or b'robot' in body:
                 print("❌ CAPTCHA detected - eBay thinks you're a bot")
                 print("   Solutions: Use proxy, reduce request frequency, or use API")
             
             # Save HTML for inspection
-            with open('debug_response.html', 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            with open('debug_response.html', 'wb') as f:
+                f.write(response.content)
             print("\n✓ Saved response to 'debug_response.html' for inspection")
             
         except Exception as e:
             print(f"❌ Error during diagnosis: {e}")
     
-    def _scrape_page(self, url):
-        """Scrape a single search results page with improved selectors"""
-        try:
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            products = []
-            
-            # Try multiple selectors as eBay's HTML can vary
-            items = soup.find_all('li', {'class': 's-item'})
-            
-            if not items:
-                # Try alternative selector
-                items = soup.find_all('div', {'class': 's-item__wrapper'})
-            
-            if self.debug_mode:
-                print(f"\nDebug: Found {len(items)} item containers")
-            
-            for idx, item in enumerate(items):
-                product = self._extract_product_data(item)
-                if product:
-                    products.append(product)
-                elif self.debug_mode and idx < 3:
-                    print(f"Debug: Failed to extract data from item {idx}")
-            
-            return products
-            
-        except requests.RequestException as e:
-            print(f"\n❌ Network Error: {e}")
-            return []
-        except Exception as e:
-            print(f"\n❌ Unexpected Error: {e}")
-            if self.debug_mode:
-                import traceback
-                traceback.print_exc()
-            return []
-    
-    def _extract_product_data(self, item):
-        """Extract only selected fields from a product listing"""
-        try:
-            product = {}
-            
-            # Title - try multiple selectors
-            if 'title' in self.selected_fields:
-                title_elem = (item.find('span', {'role': 'heading'}) or 
-                             item.find('div', {'class': 's-item__title'}) or
-                             item.find('h3', {'class': 's-item__title'}))
-                
-                if title_elem:
-                    title = title_elem.get_text(strip=True)
-                    # Skip sponsored/header items
-                    if title in ['Shop on eBay', 'New Listing', '']:
-                        return None
-                    product['title'] = title
-                else:
-                    if self.debug_mode:
-                        print("Debug: Could not find title")
-                    return None
-            
-            # Price
-            if 'price' in self.selected_fields:
-                price_elem = item.find('span', {'class': 's-item__price'})
-                product['price'] = price_elem.get_text(strip=True) if price_elem else 'N/A'
-            
-            # Condition
-            if 'condition' in self.selected_fields:
-                condition_elem = (item.find('span', {'class': 'SECONDARY_INFO'}) or
-                                item.find('span', string=lambda x: x and ('New' in x or 'Used' in x or 'Pre-Owned' in x)))
-                product['condition'] = condition_elem.get_text(strip=True) if condition_elem else 'N/A'
-            
-            # Shipping
-            if 'shipping' in self.selected_fields:
-                shipping_elem = (item.find('span', {'class': 's-item__shipping'}) or
-                               item.find('span', {'class': 's-item__logisticsCost'}))
-                product['shipping'] = shipping_elem.get_text(strip=True) if shipping_elem else 'N/A'
-            
-            # URL
-            if 'url' in self.selected_fields:
-                a_tag = item.find('a', {'class': 's-item__link'})
-                product['url'] = a_tag['href'] if a_tag and 'href' in a_tag.attrs else 'N/A'
-            
-            # Location
-            if 'location' in self.selected_fields:
-                location_elem = (item.find('span', {'class': 's-item__location'}) or
-                               item.find('span', {'class': 's-item__itemLocation'}))
-                product['location'] = location_elem.get_text(strip=True) if location_elem else 'N/A'
-            
-            # Image URL
-            if 'image_url' in self.selected_fields:
-                img_tag = item.find('img')
-                if img_tag:
-                    product['image_url'] = img_tag.get('src', img_tag.get('data-src', 'N/A'))
-                else:
-                    product['image_url'] = 'N/A'
-            
-            # Sold count
-            if 'sold_count' in self.selected_fields:
-                sold_elem = item.find('span', {'class': 's-item__quantitySold'})
-                product['sold_count'] = sold_elem.get_text(strip=True) if sold_elem else '0'
-            
-            product['scraped_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            return product if len(product) > 1 else None  # Must have more than just timestamp
-            
-        except Exception as e:
-            if self.debug_mode:
-                print(f"Debug: Extraction error - {e}")
-            return None
+    def _public_columns(self, products):
+        """Products without the internal helper columns, for display and export"""
+        return products.drop(columns=[c for c in products.columns if c.startswith('_')])
     
     def filter_by_condition(self, products, condition):
         """Filter products by condition"""
-        if not condition:
+        if not condition or products.empty:
             return products
         
-        filtered = []
-        for product in products:
-            prod_condition = product.get('condition', '').lower()
-            if condition.lower() in prod_condition:
-                filtered.append(product)
+        if '_cond_lc' not in products:
+            return products.iloc[0:0]
         
-        return filtered
+        matches = products['_cond_lc'].str.contains(condition.casefold(), regex=False)
+        return products[matches]
     
     def save_to_csv(self, products, filename='ebay_products.csv'):
         """Save products to CSV file"""
-        if not products:
+        if products.empty:
             print("No products to save")
             return
         
-        keys = products[0].keys()
-        
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(products)
+        # Large write buffer so the rows go out in a few big syscalls
+        with open(filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            self._public_columns(products).to_csv(f, index=False, lineterminator='\r\n')
         
         print(f"✓ Saved {len(products)} products to {filename}")
     
     def save_to_json(self, products, filename='ebay_products.json'):
         """Save products to JSON file"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(products, f, indent=2, ensure_ascii=False)
+        records = self._public_columns(products).to_dict('records')
+        
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(records, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, ensure_ascii=False)
         
         print(f"✓ Saved {len(products)} products to {filename}")
     
@@ -394,22 +602,13 @@ class EbayScraper:
         print("="*60)
         print(f"Total products scraped: {len(products)}")
         
-        if 'price' in self.selected_fields and products:
-            prices = []
-            for product in products:
-                try:
-                    price_str = product.get('price', '').replace('$', '').replace(',', '').replace('£', '').replace('€', '')
-                    if 'to' in price_str:
-                        price = float(price_str.split('to')[0].strip())
-                    else:
-                        price = float(price_str)
-                    prices.append(price)
-                except (ValueError, AttributeError):
-                    continue
+        if 'price' in products and not products.empty:
+            prices = products['price'].str.replace(r'[$,£€]', '', regex=True).str.split('to').str[0].str.strip()
+            prices = pd.to_numeric(prices, errors='coerce').dropna().to_numpy()
             
-            if prices:
-                print(f"Average price: ${sum(prices)/len(prices):.2f}")
-                print(f"Price range: ${min(prices):.2f} - ${max(prices):.2f}")
+            if prices.size:
+                print(f"Average price: ${prices.mean():.2f}")
+                print(f"Price range: ${prices.min():.2f} - ${prices.max():.2f}")
         
         print("="*60 + "\n")
 
@@ -431,12 +630,12 @@ def main():
     )
     
     # Apply condition filter
-    if config['condition'] and products:
+    if config['condition'] and not products.empty:
         original_count = len(products)
         products = scraper.filter_by_condition(products, config['condition'])
         print(f"\n✓ Filtered from {original_count} to {len(products)} {config['condition']} items")
     
-    if not products:
+    if products.empty:
         print("\n⚠️  No products scraped. Check the warnings above.")
         print("\nTroubleshooting tips:")
         print("1. Try a different search term")
@@ -451,7 +650,7 @@ def main():
     # Display sample products
     print("Sample products (first 3):")
     print("-" * 60)
-    for i, product in enumerate(products[:3], 1):
+    for i, product in enumerate(scraper._public_columns(products.head(3)).to_dict('records'), 1):
         print(f"\n{i}.")
         for key, value in product.items():
             if key != 'scraped_at':